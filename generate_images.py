@@ -1,12 +1,38 @@
 #!/usr/bin/python3
 
 import asyncio
+import functools
+import logging
 import os
 import re
+from itertools import chain
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
 
-import aiohttp
+from github_stats import DiskCache, Stats, get_session, run
 
-from github_stats import Stats
+
+# Pre-encoded markup for each language entry in languages.svg; the values for
+# an entry are written between consecutive fragments
+PROGRESS_FRAGMENTS = (
+    b'<span style="background-color: ',
+    b";width: ",
+    b'%;" class="progress-item"></span>',
+)
+LANG_FRAGMENTS = (
+    b'\n<li style="animation-delay: ',
+    b'ms;">\n<svg xmlns="http://www.w3.org/2000/svg" class="octicon" style="fill:',
+    b';"\nviewBox="0 0 16 16" version="1.1" width="16" height="16"><path\n'
+    b'fill-rule="evenodd" d="M8 4a4 4 0 100 8 4 4 0 000-8z"></path></svg>\n'
+    b'<span class="lang">',
+    b'</span>\n<span class="percent">',
+    b"%</span>\n</li>\n\n",
+)
+
+# Template fields, written as "{{ name }}" in the files in templates/
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# Template split into constant (encoded) segments and the fields between them
+Template = Tuple[Tuple[bytes, ...], Tuple[str, ...]]
 
 
 ################################################################################
@@ -14,124 +40,210 @@ from github_stats import Stats
 ################################################################################
 
 
+def split_template(template: str) -> Template:
+    """
+    Partially evaluate a template with "{{ placeholder }}" fields, so rendering
+    only has to interleave the constant segments with the field values
+    :param template: raw template contents
+    :return: encoded constant segments and the field names between them
+    """
+    # Split yields alternating [literal, field, literal, ..., literal] parts
+    parts = PLACEHOLDER.split(template)
+    static = tuple(part.encode("utf-8") for part in parts[::2])
+    return static, tuple(parts[1::2])
+
+
+def split_csv(value: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated environment variable
+    :param value: raw value of the variable, possibly unset
+    :return: stripped, non-empty entries without duplicates, in their original
+             order, or None if there are none
+    """
+    if not value:
+        return None
+    entries = (x.strip() for x in value.split(","))
+    return list(dict.fromkeys(x for x in entries if x)) or None
+
+
+def env_int(name: str, default: int) -> int:
+    """
+    Parse a positive integer environment variable
+    :param name: name of the variable
+    :param default: value to use if the variable is unset or invalid
+    :return: value of the variable
+    """
+    try:
+        value = int(os.getenv(name, ""))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+@functools.cache
+def load_template(name: str) -> Template:
+    """
+    Read a template from the templates folder, cached after the first call
+    :param name: file name of the template (e.g., "overview.svg")
+    :return: template split into segments and fields, as by split_template
+    """
+    with open(os.path.join("templates", name), "r") as f:
+        return split_template(f.read())
+
+
+@functools.cache
 def generate_output_folder() -> None:
     """
     Create the output folder if it does not already exist
     """
-    if not os.path.isdir("generated"):
-        os.mkdir("generated")
+    os.makedirs("generated", exist_ok=True)
+
+
+def output_is_current(name: str, data: bytes) -> bool:
+    """
+    Check whether a generated file already has the rendered contents
+    :param name: file name in the output folder (e.g., "overview.svg")
+    :param data: rendered output, as returned by render
+    :return: True if the existing file is up to date
+    """
+    try:
+        with open(os.path.join("generated", name), "rb") as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def render_languages(languages: Dict) -> Dict[str, bytes]:
+    """
+    Build the progress bar and language list for languages.svg
+    :param languages: language statistics, as returned by Stats.languages
+    :return: values to substitute into the languages template
+    """
+    if not languages:
+        print("WARNING: No languages found! Generating empty languages.svg")
+        return {"progress": b"", "lang_list": b""}
+
+    # Sort on a precomputed size column so the key function runs in C
+    rows = [
+        (data.get("size", 0), lang, data.get("color") or "#000000", data.get("prop", 0))
+        for lang, data in languages.items()
+    ]
+    rows.sort(key=itemgetter(0), reverse=True)
+    delay_between = 150
+    p0, p1, p2 = PROGRESS_FRAGMENTS
+    l0, l1, l2, l3, l4 = LANG_FRAGMENTS
+    # Append into two growing buffers instead of allocating a string per entry
+    progress = bytearray()
+    lang_list = bytearray()
+    for i, (_, lang, color, prop) in enumerate(rows):
+        color_bytes = color.encode("utf-8")
+        progress += p0
+        progress += color_bytes
+        progress += p1
+        progress += b"%0.3f" % prop
+        progress += p2
+        lang_list += l0
+        lang_list += b"%d" % (i * delay_between)
+        lang_list += l1
+        lang_list += color_bytes
+        lang_list += l2
+        lang_list += lang.encode("utf-8")
+        lang_list += l3
+        lang_list += b"%0.2f" % prop
+        lang_list += l4
+    return {"progress": bytes(progress), "lang_list": bytes(lang_list)}
+
+
+def render(template: Template, values: Dict[str, bytes]) -> bytes:
+    """
+    Fill in the fields of a split template with their values
+    :param template: split template, as returned by load_template
+    :param values: encoded values to substitute into the template
+    :return: rendered output, encoded as UTF-8
+    """
+    static, fields = template
+    field_values = [values[field] for field in fields]
+    field_values.append(b"")
+    return b"".join(chain.from_iterable(zip(static, field_values)))
+
+
+def write_output(name: str, data: bytes) -> None:
+    """
+    Write a rendered file to the output folder, unless the existing file
+    already has the same contents
+    :param name: file name in the output folder (e.g., "overview.svg")
+    :param data: rendered output, as returned by render
+    """
+    if output_is_current(name, data):
+        print(f"{name} is up to date, skipping")
+        return
+
+    generate_output_folder()
+    # A buffered file writes all of the data or raises, unlike a raw one
+    with open(os.path.join("generated", name), "wb") as f:
+        f.write(data)
+    print(f"Successfully generated {name} ({len(data)} bytes)")
 
 
 ################################################################################
-# Individual Image Generation Functions
+# Image Generation Functions
 ################################################################################
 
 
-async def generate_overview(s: Stats) -> None:
-    """
-    Generate an SVG badge with summary statistics
-    :param s: Represents user's GitHub statistics
+async def generate_all(s: Stats) -> None:
     """
-    try:
-        print("Starting generation of overview.svg...")
-        with open("templates/overview.svg", "r") as f:
-            output = f.read()
-
-        print("Fetching statistics data...")
-        output = re.sub("{{ name }}", await s.name, output)
-        output = re.sub("{{ stars }}", f"{await s.stargazers:,}", output)
-        output = re.sub("{{ forks }}", f"{await s.forks:,}", output)
-        output = re.sub("{{ contributions }}", f"{await s.total_contributions:,}", output)
-        output = re.sub("{{ views }}", f"{await s.views:,}", output)
-        output = re.sub("{{ repos }}", f"{len(await s.repos):,}", output)
-        commits = await s.total_commits
-        output = re.sub("{{ commits }}", f"{commits:,}", output)
-        output = re.sub("{{ prs }}", f"{await s.prs:,}", output)
-        output = re.sub("{{ issues }}", f"{await s.issues:,}", output)
-
-        generate_output_folder()
-        output_path = "generated/overview.svg"
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(output)
-        
-        # Verify file was created and has content
-        if not os.path.exists(output_path):
-            raise FileNotFoundError(f"Failed to create {output_path}")
-        file_size = os.path.getsize(output_path)
-        if file_size == 0:
-            raise ValueError(f"Generated {output_path} is empty!")
-        print(f"Successfully generated overview.svg ({file_size} bytes)")
-    except Exception as e:
-        print(f"ERROR generating overview.svg: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
-
-
-async def generate_languages(s: Stats) -> None:
-    """
-    Generate an SVG badge with summary languages used
+    Generate the overview and languages SVG badges, awaiting each statistic
+    exactly once and rendering both images from the shared values
     :param s: Represents user's GitHub statistics
     """
-    try:
-        print("Starting generation of languages.svg...")
-        with open("templates/languages.svg", "r") as f:
-            output = f.read()
-
-        print("Fetching languages data...")
-        languages = await s.languages
-        print(f"Found {len(languages)} languages")
-        
-        if not languages:
-            print("WARNING: No languages found! Generating empty languages.svg")
-            progress = ""
-            lang_list = ""
-        else:
-            progress = ""
-            lang_list = ""
-            sorted_languages = sorted(
-                languages.items(), reverse=True, key=lambda t: t[1].get("size")
-            )
-            delay_between = 150
-            for i, (lang, data) in enumerate(sorted_languages):
-                color = data.get("color")
-                color = color if color is not None else "#000000"
-                progress += (
-                    f'<span style="background-color: {color};'
-                    f'width: {data.get("prop", 0):0.3f}%;" '
-                    f'class="progress-item"></span>'
-                )
-                lang_list += f"""
-<li style="animation-delay: {i * delay_between}ms;">
-<svg xmlns="http://www.w3.org/2000/svg" class="octicon" style="fill:{color};"
-viewBox="0 0 16 16" version="1.1" width="16" height="16"><path
-fill-rule="evenodd" d="M8 4a4 4 0 100 8 4 4 0 000-8z"></path></svg>
-<span class="lang">{lang}</span>
-<span class="percent">{data.get("prop", 0):0.2f}%</span>
-</li>
-
-"""
-
-        output = re.sub(r"{{ progress }}", progress, output)
-        output = re.sub(r"{{ lang_list }}", lang_list, output)
-
-        generate_output_folder()
-        output_path = "generated/languages.svg"
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(output)
-        
-        # Verify file was created and has content
-        if not os.path.exists(output_path):
-            raise FileNotFoundError(f"Failed to create {output_path}")
-        file_size = os.path.getsize(output_path)
-        if file_size == 0:
-            raise ValueError(f"Generated {output_path} is empty!")
-        print(f"Successfully generated languages.svg ({file_size} bytes)")
-    except Exception as e:
-        print(f"ERROR generating languages.svg: {e}")
-        import traceback
-        traceback.print_exc()
-        raise
+    print("Fetching statistics data...")
+    (
+        name,
+        stars,
+        forks,
+        contributions,
+        views,
+        repos,
+        commits,
+        prs,
+        issues,
+        languages,
+    ) = await asyncio.gather(
+        s.name,
+        s.stargazers,
+        s.forks,
+        s.total_contributions,
+        s.views,
+        s.repos,
+        s.total_commits,
+        s.prs,
+        s.issues,
+        s.languages,
+    )
+    print(f"Found {len(languages)} languages")
+    overview_fields = {
+        "name": name,
+        "stars": f"{stars:,}",
+        "forks": f"{forks:,}",
+        "contributions": f"{contributions:,}",
+        "views": f"{views:,}",
+        "repos": f"{len(repos):,}",
+        "commits": f"{commits:,}",
+        "prs": f"{prs:,}",
+        "issues": f"{issues:,}",
+    }
+    overview_values = {k: v.encode("utf-8") for k, v in overview_fields.items()}
+
+    # Render and write off the event loop so other coroutines keep running
+    languages_values = await asyncio.to_thread(render_languages, languages)
+    overview_svg, languages_svg = await asyncio.gather(
+        asyncio.to_thread(render, load_template("overview.svg"), overview_values),
+        asyncio.to_thread(render, load_template("languages.svg"), languages_values),
+    )
+    await asyncio.gather(
+        asyncio.to_thread(write_output, "overview.svg", overview_svg),
+        asyncio.to_thread(write_output, "languages.svg", languages_svg),
+    )
 
 
 ################################################################################
@@ -143,6 +255,7 @@ async def main() -> None:
     """
     Generate all badges
     """
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     access_token = os.getenv("ACCESS_TOKEN")
     if not access_token:
         # access_token = os.getenv("GITHUB_TOKEN")
@@ -150,26 +263,29 @@ async def main() -> None:
     user = os.getenv("GITHUB_ACTOR")
     if user is None:
         raise RuntimeError("Environment variable GITHUB_ACTOR must be set.")
-    exclude_repos = os.getenv("EXCLUDED")
-    excluded_repos = (
-        {x.strip() for x in exclude_repos.split(",")} if exclude_repos else None
-    )
-    exclude_langs = os.getenv("EXCLUDED_LANGS")
-    excluded_langs = (
-        {x.strip() for x in exclude_langs.split(",")} if exclude_langs else None
-    )
+    exclude_repos = split_csv(os.getenv("EXCLUDED"))
+    excluded_repos = set(exclude_repos) if exclude_repos else None
+    exclude_langs = split_csv(os.getenv("EXCLUDED_LANGS"))
+    excluded_langs = set(exclude_langs) if exclude_langs else None
     # Convert a truthy value to a Boolean
     raw_ignore_forked_repos = os.getenv("EXCLUDE_FORKED_REPOS")
-    ignore_forked_repos = (
-        not not raw_ignore_forked_repos
-        and raw_ignore_forked_repos.strip().lower() != "false"
-    )
-    emails = os.getenv("GIT_EMAILS")
-    email_list = (
-        list({x.strip() for x in emails.split(",")}) if emails else None
+    ignore_forked_repos = (raw_ignore_forked_repos or "").strip().lower() not in (
+        "",
+        "false",
+        "0",
     )
-    
-    async with aiohttp.ClientSession() as session:
+    email_list = split_csv(os.getenv("GIT_EMAILS"))
+    # Optional: reuse API responses from recent runs, e.g., between CI jobs
+    cache_file = os.getenv("CACHE_FILE")
+    disk_cache = DiskCache(cache_file) if cache_file else None
+
+    # Stay below GitHub's secondary rate limit for concurrent requests
+    max_graphql = env_int("MAX_GRAPHQL_CONNECTIONS", 10)
+    max_rest = env_int("MAX_REST_CONNECTIONS", 20)
+
+    # Reuse keep-alive connections to api.github.com across all API calls,
+    # with enough of them for every request the semaphores allow at once
+    async with get_session(max_graphql + max_rest) as session:
         s = Stats(
             user,
             access_token,
@@ -178,24 +294,27 @@ async def main() -> None:
             exclude_langs=excluded_langs,
             ignore_forked_repos=ignore_forked_repos,
             emails=email_list,
+            max_graphql=max_graphql,
+            max_rest=max_rest,
+            disk_cache=disk_cache,
+            disk_cache_ttl=env_int("CACHE_TTL", 3600),
         )
         try:
             # Pre-fetch stats to ensure data is loaded before generating images
             print("Pre-fetching repository statistics...")
-            await s.get_stats()
+            await s.get_all_stats()
             print(f"Stats loaded: {len(await s.repos)} repos, {len(await s.languages)} languages")
             
-            # Generate both images (stats already loaded, so parallel is safe now)
-            await generate_overview(s)
-            await generate_languages(s)
-                    
+            await generate_all(s)
+
             print("All images generated successfully!")
-        except Exception as e:
-            print(f"FATAL ERROR during image generation: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logging.exception("FATAL ERROR during image generation")
             raise
+        finally:
+            if disk_cache is not None:
+                disk_cache.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run(main())
\ No newline at end of file
@@ -1,11 +1,136 @@
 #!/usr/bin/python3
 
 import asyncio
+import functools
+import hashlib
+import json
+import logging
 import os
-from typing import Dict, List, Optional, Set, Tuple, Any, cast
+import random
+import sqlite3
+import time
+from collections import OrderedDict, defaultdict
+from itertools import islice
+from typing import (
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Any,
+)
 
 import aiohttp
-import requests
+
+try:
+    # orjson decodes the GitHub API responses several times faster; fall back
+    # to the standard library if it is not installed
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    # Optional: msgpack is faster to encode and decode than JSON for the
+    # responses kept in the disk cache, and smaller to store
+    import ormsgpack
+except ImportError:
+    ormsgpack = None  # type: ignore[assignment]
+
+
+logger = logging.getLogger(__name__)
+
+# Session returned by get_session, shared until its owner closes it
+_session: Optional[aiohttp.ClientSession] = None
+# Sent with every request through the shared session. Authorization depends
+# on the token of each Queries instance, so it is added per request.
+# Accept-Encoding is left to aiohttp, which also offers Brotli ("br") when the
+# brotli package is installed.
+SESSION_HEADERS = {
+    "Accept": "application/vnd.github+json",
+    "User-Agent": "github-stats",
+}
+# Seconds allowed for one request, including reading the response
+REQUEST_TIMEOUT = 30
+
+
+###############################################################################
+# Helper Functions
+###############################################################################
+
+
+def get_session(max_connections: int = 30) -> aiohttp.ClientSession:
+    """
+    Return the shared client session, creating it on first use. Its connection
+    pool keeps TLS connections to api.github.com alive across all requests, so
+    only the first few requests pay for a handshake. The caller that owns the
+    program's lifetime is responsible for closing it.
+    :param max_connections: connections allowed to api.github.com; should be
+                            at least the GraphQL and REST limits combined, so
+                            the pool never queues requests the semaphores let
+                            through. Only used when the session is created.
+    :return: open session with a tuned connection pool
+    """
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=max(100, max_connections),
+            limit_per_host=max_connections,
+            ttl_dns_cache=300,
+            keepalive_timeout=75,
+            enable_cleanup_closed=True,
+        )
+        # Status codes are handled explicitly by the retry logic in Queries,
+        # which also retries a request that stalls past the timeout rather
+        # than waiting for aiohttp's default of five minutes
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=SESSION_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=10),
+            raise_for_status=False,
+        )
+    return _session
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    :param items: values to split into batches
+    :param size: maximum number of values per batch
+    :return: consecutive lists of at most size values
+    """
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+@functools.cache
+def year_window(year: Any) -> Tuple[str, str]:
+    """
+    :param year: calendar year
+    :return: ISO 8601 timestamps of the start of that year and of the next
+             one, formatted once per year and reused across queries
+    """
+    year = int(year)
+    return f"{year}-01-01T00:00:00Z", f"{year + 1}-01-01T00:00:00Z"
+
+
+def run(main: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run a coroutine on uvloop's event loop if it is installed, which handles
+    socket I/O faster than the default asyncio loop, or on the default loop
+    otherwise (e.g., on Windows, where uvloop is not available)
+    :param main: coroutine to run until it completes
+    :return: result of the coroutine
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(main)
+    return uvloop.run(main)
 
 
 ###############################################################################
@@ -13,142 +138,663 @@ import requests
 ###############################################################################
 
 
+class ConcurrencyLimit(object):
+    """
+    Limit on the number of requests in flight, like asyncio.Semaphore, except
+    that the limit can be lowered after requests have started
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._active = 0
+        # Notified whenever a request finishes
+        self._released = asyncio.Condition()
+
+    def lower(self, limit: int) -> None:
+        """
+        Lower the limit; requests already in flight are not interrupted
+        :param limit: new limit, ignored unless below the current one
+        """
+        if limit < self.limit:
+            logger.info(
+                "Lowering concurrent requests from %d to %d", self.limit, limit
+            )
+            self.limit = limit
+
+    async def __aenter__(self) -> None:
+        async with self._released:
+            await self._released.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        async with self._released:
+            self._active -= 1
+            self._released.notify()
+
+
+class RateLimiter(object):
+    """
+    Shared view of one GitHub rate limit. Once a response reports that the
+    limit is exhausted, every other request waits for the reset here instead
+    of sending its own request that is bound to be rejected.
+    """
+
+    def __init__(self) -> None:
+        self.remaining: Optional[int] = None
+        # Requests allowed per hour, as last reported by the API
+        self.limit: Optional[int] = None
+        self.reset_at: float = 0.0
+        # Set while requests may be sent; cleared until the limit resets
+        self._open = asyncio.Event()
+        self._open.set()
+
+    def is_open(self) -> bool:
+        """
+        :return: True if requests may currently be sent
+        """
+        return self._open.is_set()
+
+    async def wait(self) -> None:
+        """
+        Wait until requests may be sent
+        """
+        await self._open.wait()
+
+    def update(self, headers: Any) -> None:
+        """
+        Record the rate limit state reported by a response, and hold back
+        further requests if it is exhausted
+        :param headers: headers of the response
+        """
+        delay = None
+        retry_after = headers.get("Retry-After")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        limit = headers.get("X-RateLimit-Limit")
+        if limit is not None and limit.isdigit():
+            self.limit = int(limit)
+        if remaining is not None and remaining.isdigit():
+            self.remaining = int(remaining)
+            if self.remaining == 0 and reset is not None and reset.isdigit():
+                self.reset_at = int(reset)
+                delay = self.reset_at - time.time()
+        # Secondary rate limits only report how long to back off
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay or 0.0, float(retry_after))
+        if delay is None or not self._open.is_set():
+            return
+        logger.warning("Rate limit reached, pausing requests for %.0fs", delay)
+        self._open.clear()
+        asyncio.get_running_loop().call_later(max(0.0, delay), self._open.set)
+
+
+class DiskCache(object):
+    """
+    Response cache stored in a SQLite database, so that runs shortly after one
+    another (e.g., repeated CI jobs) can reuse the responses of earlier runs.
+    Errors reading or writing the database are logged and treated as misses,
+    and a file that cannot be opened as a database is replaced with an empty
+    one. Writes are committed together when the cache is closed.
+    """
+
+    # Bumped when the tables change; older databases are emptied and recreated
+    schema_version = 2
+
+    # Leads values stored as msgpack; it is never the first byte of JSON, and
+    # msgpack itself leaves it unused, so JSON values from older caches (or
+    # from runs without ormsgpack) are still recognized
+    msgpack_marker = b"\xc1"
+
+    def __init__(self, path: str, json_loads: Callable[[Any], Any] = json_loads):
+        self.path = path
+        self.json_loads = json_loads
+        try:
+            self._db = self._open()
+        except sqlite3.DatabaseError as e:
+            # e.g., a corrupt file restored from an earlier run's cache
+            logger.warning("Recreating unreadable disk cache %s: %s", path, e)
+            os.remove(path)
+            self._db = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        """
+        :return: connection to the database, with the tables of the current
+                 schema_version
+        """
+        db = sqlite3.connect(self.path)
+        try:
+            self._create_tables(db)
+        except sqlite3.Error:
+            db.close()
+            raise
+        return db
+
+    def _create_tables(self, db: sqlite3.Connection) -> None:
+        """
+        Create the tables, emptying a database with an older schema
+        :param db: open connection to the database
+        """
+        with db:
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+            if version != self.schema_version:
+                db.execute("DROP TABLE IF EXISTS responses")
+                db.execute("DROP TABLE IF EXISTS etags")
+                db.execute(f"PRAGMA user_version = {self.schema_version}")
+            # Responses with an ETag are kept after they expire, to revalidate
+            # them with conditional requests
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                "stored REAL NOT NULL, etag TEXT, value BLOB NOT NULL)"
+            )
+
+    def get(self, key: str, ttl: float) -> Optional[Any]:
+        """
+        :param key: response cache key
+        :param ttl: maximum age of the response, in seconds
+        :return: cached response, or None if missing or expired
+        """
+        try:
+            row = self._db.execute(
+                "SELECT stored, value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Could not read from disk cache %s: %s", self.path, e)
+            return None
+        if row is None or time.time() - row[0] > ttl:
+            return None
+        return self.decode(row[1])
+
+    def put(self, key: str, result: Any, etag: Optional[str] = None) -> None:
+        """
+        :param key: response cache key
+        :param result: decoded response to store
+        :param etag: ETag header of the response, if it has one
+        """
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, time.time(), etag, self.encode(result)),
+            )
+        except sqlite3.Error as e:
+            logger.warning("Could not write to disk cache %s: %s", self.path, e)
+
+    def touch(self, key: str) -> None:
+        """
+        Mark a stored response as fresh again, e.g., after revalidating it
+        :param key: response cache key
+        """
+        try:
+            self._db.execute(
+                "UPDATE responses SET stored = ? WHERE key = ?", (time.time(), key)
+            )
+        except sqlite3.Error as e:
+            logger.warning("Could not write to disk cache %s: %s", self.path, e)
+
+    def get_etag(self, key: str) -> Optional[Tuple[str, Any]]:
+        """
+        :param key: response cache key
+        :return: ETag and decoded body of the last full response, if any,
+                 regardless of its age
+        """
+        try:
+            row = self._db.execute(
+                "SELECT etag, value FROM responses "
+                "WHERE key = ? AND etag IS NOT NULL",
+                (key,),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Could not read from disk cache %s: %s", self.path, e)
+            return None
+        result = None if row is None else self.decode(row[1])
+        if result is None:
+            return None
+        return row[0], result
+
+    def encode(self, result: Any) -> bytes:
+        """
+        :param result: decoded response
+        :return: response serialized for storage, as msgpack if available
+        """
+        if ormsgpack is not None:
+            return self.msgpack_marker + ormsgpack.packb(result)
+        return json.dumps(result).encode("utf-8")
+
+    def decode(self, value: bytes) -> Optional[Any]:
+        """
+        :param value: stored response, as returned by encode
+        :return: decoded response, or None if it cannot be decoded here (e.g.,
+                 msgpack without ormsgpack installed, or a damaged value)
+        """
+        try:
+            if value[:1] != self.msgpack_marker:
+                return self.json_loads(value)
+            if ormsgpack is None:
+                return None
+            return ormsgpack.unpackb(memoryview(value)[1:])
+        except (TypeError, ValueError) as e:
+            logger.warning("Could not decode disk cache entry in %s: %s", self.path, e)
+            return None
+
+    def close(self) -> None:
+        """
+        Commit the responses stored during this run and close the database
+        """
+        try:
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Could not write to disk cache %s: %s", self.path, e)
+        self._db.close()
+
+
 class Queries(object):
     """
     Class with functions to query the GitHub GraphQL (v4) API and the REST (v3)
     API. Also includes functions to dynamically generate GraphQL queries.
     """
 
+    # Maximum number of attempts for a request that keeps being retried
+    max_retries = 8
+    # Transient server errors, retried with backoff instead of returning (and
+    # caching) the error response
+    retry_statuses = frozenset({500, 502, 503, 504})
+
     def __init__(
         self,
         username: str,
         access_token: str,
         session: aiohttp.ClientSession,
-        max_connections: int = 10,
+        max_graphql: int = 10,
+        max_rest: int = 20,
+        json_loads: Callable[[Any], Any] = json_loads,
+        cache_size: int = 256,
+        cache_ttl: float = 60,
+        disk_cache: Optional[DiskCache] = None,
+        disk_cache_ttl: float = 3600,
     ):
         self.username = username
         self.access_token = access_token
         self.session = session
-        self.semaphore = asyncio.Semaphore(max_connections)
+        # Separate limits, so a burst of REST calls (e.g., one per repository)
+        # does not hold up GraphQL queries and vice versa
+        # Lowered once the hourly quota of the token is known, see
+        # concurrency_for
+        self.graphql_semaphore = ConcurrencyLimit(max_graphql)
+        self.rest_semaphore = ConcurrencyLimit(max_rest)
+        # GraphQL and REST calls are counted against separate rate limits
+        self.graphql_limiter = RateLimiter()
+        self.rest_limiter = RateLimiter()
+        self.json_loads = json_loads
+        # Built once here instead of on every request; both APIs accept the
+        # same Bearer scheme
+        self._headers = {"Authorization": f"Bearer {access_token}"}
+
+        # LRU cache of successful responses: key -> (time stored, response)
+        self._cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        # One lock per key in flight, so identical concurrent requests share
+        # a single HTTP call
+        self._cache_locks: Dict[str, asyncio.Lock] = dict()
+        # Optional cache that outlives this process
+        self.disk_cache = disk_cache
+        self.disk_cache_ttl = disk_cache_ttl
 
-    async def query(self, generated_query: str) -> Dict:
+    @staticmethod
+    def cache_key(*parts: Any) -> str:
         """
-        Make a request to the GraphQL API using the authentication token from
-        the environment
-        :param generated_query: string query to be sent to the API
-        :return: decoded GraphQL JSON output
+        :param parts: values identifying a request
+        :return: hash of the request, used as the response cache key
         """
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-        }
-        try:
-            async with self.semaphore:
-                r_async = await self.session.post(
-                    "https://api.github.com/graphql",
-                    headers=headers,
-                    json={"query": generated_query},
-                )
-            result = await r_async.json()
+        return hashlib.blake2b(repr(parts).encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[Any]:
+        """
+        :param key: response cache key
+        :return: cached response, or None if missing or expired
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        stored, result = entry
+        if time.monotonic() - stored > self._cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _cache_put(self, key: str, result: Any) -> None:
+        """
+        Store a response, evicting the least recently used one if full
+        :param key: response cache key
+        :param result: decoded response to store
+        """
+        self._cache[key] = (time.monotonic(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    async def _cached(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool],
+        disk_ttl: Optional[float] = None,
+        store_on_disk: bool = True,
+    ) -> Any:
+        """
+        Return a cached response, or fetch it if it is not cached. Concurrent
+        calls for the same key wait for the first one instead of refetching.
+        :param key: response cache key
+        :param fetch: coroutine function that performs the request
+        :param cacheable: predicate deciding whether a response may be cached
+        :param disk_ttl: maximum age of a response in the disk cache, in
+                         seconds; defaults to disk_cache_ttl
+        :param store_on_disk: False if fetch stores the response on disk itself
+        :return: decoded response
+        """
+        result = self._cache_get(key)
+        if result is not None:
+            return result
+        lock = self._cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            result = self._cache_get(key)
             if result is not None:
                 return result
-        except Exception:
-            print("aiohttp failed for GraphQL query")
-            # Fall back on non-async requests
-            async with self.semaphore:
-                r_requests = requests.post(
-                    "https://api.github.com/graphql",
-                    headers=headers,
-                    json={"query": generated_query},
+            if self.disk_cache is not None:
+                result = self.disk_cache.get(
+                    key, self.disk_cache_ttl if disk_ttl is None else disk_ttl
                 )
-                result = r_requests.json()
+            if result is None:
+                result = await fetch()
+                if store_on_disk and cacheable(result) and self.disk_cache is not None:
+                    self.disk_cache.put(key, result)
+            if cacheable(result):
+                self._cache_put(key, result)
+        if self._cache_locks.get(key) is lock and not lock.locked():
+            del self._cache_locks[key]
+        return result
+
+    async def query(
+        self,
+        generated_query: str,
+        disk_ttl: Optional[float] = None,
+        variables: Optional[Dict[str, Any]] = None,
+    ) -> Dict:
+        """
+        Make a request to the GraphQL API using the authentication token from
+        the environment. Responses are cached for a short time.
+        :param generated_query: string query to be sent to the API
+        :param disk_ttl: maximum age of a response in the disk cache, for
+                         queries whose results change more slowly than most
+        :param variables: values of the variables declared by the query
+        :return: decoded GraphQL JSON output
+        """
+        return await self._cached(
+            self.cache_key(
+                "graphql",
+                self.username,
+                generated_query,
+                sorted((variables or {}).items()),
+            ),
+            lambda: self._query(generated_query, variables),
+            lambda result: bool(result.get("data")),
+            disk_ttl,
+        )
+
+    async def query_rest(self, path: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Make a request to the REST API. Responses are cached for a short time.
+        :param path: API path to query
+        :param params: Query parameters to be passed to the API
+        :return: deserialized REST JSON output
+        """
+        path = path.lstrip("/")
+        key = self.cache_key(
+            "rest", self.username, path, sorted((params or {}).items())
+        )
+        # _query_rest stores the response together with its ETag
+        return await self._cached(
+            key, lambda: self._query_rest(path, params, key), bool, store_on_disk=False
+        )
+
+    async def _query(
+        self, generated_query: str, variables: Optional[Dict[str, Any]] = None
+    ) -> Dict:
+        """
+        Make an uncached request to the GraphQL API
+        :param generated_query: string query to be sent to the API
+        :param variables: values of the variables declared by the query
+        :return: decoded GraphQL JSON output
+        """
+        payload: Dict[str, Any] = {"query": generated_query}
+        if variables:
+            payload["variables"] = variables
+        for attempt in range(self.max_retries):
+            try:
+                await self.graphql_limiter.wait()
+                async with self.graphql_semaphore:
+                    r_async = await self.session.post(
+                        "https://api.github.com/graphql",
+                        headers=self._headers,
+                        json=payload,
+                    )
+                self.graphql_limiter.update(r_async.headers)
+                if self.graphql_limiter.limit is not None:
+                    self.graphql_semaphore.lower(
+                        self.concurrency_for(self.graphql_limiter.limit)
+                    )
+                if self.is_rate_limited(r_async.status, r_async.headers):
+                    r_async.release()
+                    await self._rate_limit_backoff(
+                        self.graphql_limiter, r_async.headers, attempt
+                    )
+                    continue
+                if r_async.status in self.retry_statuses:
+                    logger.warning(
+                        "GraphQL query returned %d, retrying...", r_async.status
+                    )
+                    r_async.release()
+                    await self._backoff(r_async.headers, attempt)
+                    continue
+                # Read the body into a single buffer and decode the raw bytes
+                # directly, skipping aiohttp's text decoding; unread responses
+                # are released above so their connections return to the pool
+                body = await r_async.read()
+                result = self.json_loads(body) if body else None
+                # The primary GraphQL limit may also be reported with a 200
+                if self.is_rate_limited_result(result):
+                    logger.warning("GraphQL query was rate limited, retrying...")
+                    await self._rate_limit_backoff(
+                        self.graphql_limiter, r_async.headers, attempt
+                    )
+                    continue
                 if result is not None:
                     return result
+            except Exception as e:
+                logger.warning("aiohttp failed for GraphQL query: %s", e)
+            await self._backoff({}, attempt)
         return dict()
 
-    async def query_rest(self, path: str, params: Optional[Dict] = None) -> Dict:
+    async def _query_rest(
+        self, path: str, params: Optional[Dict] = None, key: Optional[str] = None
+    ) -> Dict:
         """
-        Make a request to the REST API
+        Make a request to the REST API, bypassing the in-memory cache
         :param path: API path to query
         :param params: Query parameters to be passed to the API
+        :param key: disk cache key of the response; if given, a stored response
+                    is revalidated with its ETag, and the new response is stored
         :return: deserialized REST JSON output
         """
-
-        for attempt in range(60):
+        headers = self._headers
+        # API de busca de commits requer header especial
+        if "/search/commits" in path:
             headers = {
-                "Authorization": f"token {self.access_token}",
+                **headers,
+                "Accept": "application/vnd.github.cloak-preview+json",
             }
-
-            # API de busca de commits requer header especial
-            if "/search/commits" in path:
-                headers["Accept"] = "application/vnd.github.cloak-preview+json"
-
-            if params is None:
-                params = dict()
-            if path.startswith("/"):
-                path = path[1:]
+        path = path.lstrip("/")
+        url = f"https://api.github.com/{path}"
+
+        # Revalidate the last full response; a 304 reply does not count
+        # against the rate limit
+        disk_cache = self.disk_cache if key is not None else None
+        validated = None
+        if disk_cache is not None:
+            validated = disk_cache.get_etag(key)
+            if validated is not None:
+                headers = {**headers, "If-None-Match": validated[0]}
+
+        for attempt in range(self.max_retries):
             try:
-                async with self.semaphore:
+                await self.rest_limiter.wait()
+                async with self.rest_semaphore:
                     r_async = await self.session.get(
-                        f"https://api.github.com/{path}",
-                        headers=headers,
-                        params=tuple(params.items()),
+                        url, headers=headers, params=params
+                    )
+                self.rest_limiter.update(r_async.headers)
+                if self.rest_limiter.limit is not None:
+                    self.rest_semaphore.lower(
+                        self.concurrency_for(self.rest_limiter.limit)
                     )
+                if r_async.status == 304 and validated is not None:
+                    r_async.release()
+                    if disk_cache is not None:
+                        disk_cache.touch(key)
+                    return validated[1]
+                # 202: statistics are still being computed
                 if r_async.status == 202:
-                    print(
-                        f"Request to {path} returned 202 (processing). Retrying in 2s... (attempt {attempt + 1}/60)"
+                    r_async.release()
+                    await self._backoff(r_async.headers, attempt)
+                    continue
+                elif self.is_rate_limited(r_async.status, r_async.headers):
+                    r_async.release()
+                    await self._rate_limit_backoff(
+                        self.rest_limiter, r_async.headers, attempt
                     )
-                    await asyncio.sleep(2)
                     continue
-                elif r_async.status == 403:
-                    print(
-                        f"Request to {path} returned 403 (rate limit). Retrying in 5s... (attempt {attempt + 1}/60)"
+                elif r_async.status in self.retry_statuses:
+                    logger.warning(
+                        "Request to %s returned %d, retrying...", path, r_async.status
                     )
-                    await asyncio.sleep(5)
+                    r_async.release()
+                    await self._backoff(r_async.headers, attempt)
                     continue
+                elif r_async.status == 403:
+                    r_async.release()
+                    # e.g., traffic statistics need push access to the repo
+                    logger.info(
+                        "Request to %s returned 403 (forbidden). Skipping...", path
+                    )
+                    return dict()
                 elif r_async.status == 404:
-                    print(f"Request to {path} returned 404 (not found). Skipping...")
+                    r_async.release()
+                    logger.info(
+                        "Request to %s returned 404 (not found). Skipping...", path
+                    )
                     return dict()
 
-                result = await r_async.json()
+                body = await r_async.read()
+                # 204: no content, e.g. statistics of an empty repository
+                if not body:
+                    return dict()
+                result = self.json_loads(body)
                 if result is not None:
+                    if result and disk_cache is not None:
+                        etag = r_async.headers.get("ETag")
+                        disk_cache.put(
+                            key, result, etag if r_async.status == 200 else None
+                        )
                     return result
             except Exception as e:
-                print(f"aiohttp failed for rest query to {path}: {e}")
-                # Fall back on non-async requests
-                try:
-                    async with self.semaphore:
-                        r_requests = requests.get(
-                            f"https://api.github.com/{path}",
-                            headers=headers,
-                            params=tuple(params.items()),
-                        )
-                        if r_requests.status_code == 202:
-                            print(
-                                f"Fallback request to {path} returned 202. Retrying in 2s... (attempt {attempt + 1}/60)"
-                            )
-                            await asyncio.sleep(2)
-                            continue
-                        elif r_requests.status_code == 403:
-                            print(
-                                f"Fallback request to {path} returned 403. Retrying in 5s... (attempt {attempt + 1}/60)"
-                            )
-                            await asyncio.sleep(5)
-                            continue
-                        elif r_requests.status_code == 404:
-                            print(
-                                f"Fallback request to {path} returned 404. Skipping..."
-                            )
-                            return dict()
-                        elif r_requests.status_code == 200:
-                            result_json = r_requests.json()
-                            if result_json is not None:
-                                return result_json
-                except Exception as e2:
-                    print(f"Both aiohttp and requests failed for {path}: {e2}")
-
-        print(f"Too many retries for {path}. Data will be incomplete.")
+                logger.warning("aiohttp failed for rest query to %s: %s", path, e)
+                await self._backoff({}, attempt)
+
+        logger.warning(
+            "Too many retries for %s (%d attempts). Data will be incomplete.",
+            path,
+            self.max_retries,
+        )
         return dict()
 
+    async def _backoff(self, headers: Any, attempt: int) -> None:
+        """
+        Wait before retrying a request, unless no attempts are left
+        :param headers: headers of the response that should be retried
+        :param attempt: number of attempts already made, starting at 0
+        """
+        if attempt < self.max_retries - 1:
+            await asyncio.sleep(self.retry_delay(headers, attempt))
+
+    async def _rate_limit_backoff(
+        self, limiter: RateLimiter, headers: Any, attempt: int
+    ) -> None:
+        """
+        Wait before retrying a request rejected by a rate limit. An exhausted
+        limit is waited out by the limiter before the next attempt, so this
+        only backs off if the limiter is still open (e.g., secondary limits).
+        :param limiter: rate limiter of the API that rejected the request
+        :param headers: headers of the rejected response
+        :param attempt: number of attempts already made, starting at 0
+        """
+        if limiter.is_open():
+            await self._backoff(headers, attempt)
+
+    @staticmethod
+    def concurrency_for(limit: int) -> int:
+        """
+        :param limit: requests allowed per hour, from X-RateLimit-Limit
+        :return: number of requests that may be in flight at once without
+                 tripping the secondary rate limits; tokens with a small
+                 quota (e.g., GITHUB_TOKEN) get fewer
+        """
+        return max(4, min(32, limit // 500))
+
+    @staticmethod
+    def is_rate_limited(status: int, headers: Any) -> bool:
+        """
+        :param status: HTTP status of a response
+        :param headers: headers of the response
+        :return: True if the request was rejected by a primary or secondary
+                 rate limit, rather than for lack of permission
+        """
+        if status == 429:
+            return True
+        return status == 403 and (
+            "Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0"
+        )
+
+    @staticmethod
+    def is_rate_limited_result(result: Any) -> bool:
+        """
+        :param result: decoded GraphQL response
+        :return: True if the query was rejected by a rate limit, which GraphQL
+                 can report in the errors of an otherwise successful response
+        """
+        if not isinstance(result, dict):
+            return False
+        return any(
+            isinstance(error, dict) and error.get("type") == "RATE_LIMITED"
+            for error in result.get("errors") or ()
+        )
+
+    @staticmethod
+    def retry_delay(headers: Any, attempt: int) -> float:
+        """
+        :param headers: headers of the response that should be retried
+        :param attempt: number of attempts already made, starting at 0
+        :return: number of seconds to wait before retrying the request
+        """
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            # Jitter, so waiting requests do not all retry at the same instant
+            return float(retry_after) + random.uniform(0, 0.5)
+        reset = headers.get("X-RateLimit-Reset")
+        if headers.get("X-RateLimit-Remaining") == "0" and reset is not None:
+            return max(0.0, int(reset) - time.time())
+        # Exponential backoff with jitter, capped at 30s
+        return min(30.0, 0.5 * 2**attempt) + random.uniform(0, 0.25)
+
     @staticmethod
     def summary_query() -> str:
         """
@@ -183,17 +829,46 @@ class Queries(object):
 }
 """
 
-    @staticmethod
-    def repos_overview(
-        contrib_cursor: Optional[str] = None, owned_cursor: Optional[str] = None
-    ) -> str:
+    # Fields fetched for every repository in the owned and contributed pages
+    repo_fields = """
+        nameWithOwner
+        stargazers {
+          totalCount
+        }
+        forkCount
+        languages(first: 10, orderBy: {field: SIZE, direction: DESC}) {
+          edges {
+            size
+            node {
+              name
+              color
+            }
+          }
+        }"""
+
+    @classmethod
+    def owned_repos_page(cls, include_summary: bool = False) -> str:
         """
-        :return: GraphQL query with overview of user repositories
+        :param include_summary: also fetch the pull request and issue counts
+        :return: GraphQL query with a page of the user's own repositories,
+                 starting after the $cursor variable (null for the first page)
         """
-        return f"""{{
+        summary = (
+            """
+    pullRequests(first: 1) {
+      totalCount
+    }
+    issues(first: 1) {
+      totalCount
+    }"""
+            if include_summary
+            else ""
+        )
+        return f"""query($cursor: String) {{
   viewer {{
+    id
     login
-    name
+    name{summary}
     repositories(
         first: 100,
         orderBy: {{
@@ -201,29 +876,28 @@ class Queries(object):
             direction: DESC
         }},
         isFork: false,
-        after: {"null" if owned_cursor is None else '"' + owned_cursor + '"'}
+        after: $cursor
     ) {{
       pageInfo {{
         hasNextPage
         endCursor
       }}
-      nodes {{
-        nameWithOwner
-        stargazers {{
-          totalCount
-        }}
-        forkCount
-        languages(first: 10, orderBy: {{field: SIZE, direction: DESC}}) {{
-          edges {{
-            size
-            node {{
-              name
-              color
-            }}
-          }}
-        }}
+      nodes {{{cls.repo_fields}
       }}
     }}
+  }}
+}}
+"""
+
+    @classmethod
+    def contrib_repos_page(cls) -> str:
+        """
+        :return: GraphQL query with a page of other repositories the user has
+                 contributed to, starting after the $cursor variable (null for
+                 the first page)
+        """
+        return f"""query($cursor: String) {{
+  viewer {{
     repositoriesContributedTo(
         first: 100,
         includeUserRepositories: false,
@@ -237,31 +911,81 @@ class Queries(object):
             REPOSITORY,
             PULL_REQUEST_REVIEW
         ]
-        after: {"null" if contrib_cursor is None else '"' + contrib_cursor + '"'}
+        after: $cursor
     ) {{
       pageInfo {{
         hasNextPage
         endCursor
       }}
-      nodes {{
-        nameWithOwner
-        stargazers {{
-          totalCount
-        }}
-        forkCount
-        languages(first: 10, orderBy: {{field: SIZE, direction: DESC}}) {{
-          edges {{
-            size
-            node {{
-              name
-              color
+      nodes {{{cls.repo_fields}
+      }}
+    }}
+  }}
+}}
+"""
+
+    @staticmethod
+    def repo_contributor_stats_batch(repos: List[str], user_id: str) -> str:
+        """
+        :param repos: names of repositories, as "owner/name"
+        :param user_id: GraphQL node ID of the user whose commits are counted
+        :return: GraphQL query with the lines changed by the user in each
+                 repository, aliased r0, r1, ... in the order of repos
+        """
+        aliases = []
+        for i, repo in enumerate(repos):
+            owner, name = repo.split("/", 1)
+            aliases.append(
+                f"""
+  r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{
+    defaultBranchRef {{
+      target {{
+        ... on Commit {{
+          history(first: 100, author: {{id: {json.dumps(user_id)}}}) {{
+            pageInfo {{
+              hasNextPage
+            }}
+            nodes {{
+              additions
+              deletions
             }}
           }}
         }}
       }}
     }}
-  }}
+  }}"""
+            )
+        return f"""query {{{"".join(aliases)}
 }}
+"""
+
+    @staticmethod
+    def user_commits() -> str:
+        """
+        :return: GraphQL query with the commit contributions in the last year
+                 of the user given by the $login variable
+        """
+        return """query($login: String!) {
+  user(login: $login) {
+    contributionsCollection {
+      totalCommitContributions
+    }
+  }
+}
+"""
+
+    @staticmethod
+    def user_forks() -> str:
+        """
+        :return: GraphQL query with the number of forks made by the user
+        """
+        return """query {
+  viewer {
+    repositories(first: 1, isFork: true, ownerAffiliations: OWNER) {
+      totalCount
+    }
+  }
+}
 """
 
     @staticmethod
@@ -280,29 +1004,34 @@ query {
 """
 
     @staticmethod
-    def contribs_by_year(year: str) -> str:
+    def contribs_and_commits_by_year(year: str) -> str:
         """
         :param year: year to query for
-        :return: portion of a GraphQL query with desired info for a given year
+        :return: portion of a GraphQL query with the contributions and commits
+                 for a given year
         """
+        start, end = year_window(year)
         return f"""
     year{year}: contributionsCollection(
-        from: "{year}-01-01T00:00:00Z",
-        to: "{int(year) + 1}-01-01T00:00:00Z"
+        from: "{start}",
+        to: "{end}"
     ) {{
       contributionCalendar {{
         totalContributions
       }}
+      totalCommitContributions
+      restrictedContributionsCount
     }}
 """
 
     @classmethod
-    def all_contribs(cls, years: List[str]) -> str:
+    def all_contribs_and_commits(cls, years: List[str]) -> str:
         """
         :param years: list of years to get contributions for
-        :return: query to retrieve contribution information for all user years
+        :return: query to retrieve contribution and commit counts for all user
+                 years
         """
-        by_years = "\n".join(map(cls.contribs_by_year, years))
+        by_years = "\n".join(map(cls.contribs_and_commits_by_year, years))
         return f"""
 query {{
   viewer {{
@@ -317,6 +1046,17 @@ class Stats(object):
     Retrieve and store statistics about GitHub usage.
     """
 
+    # Number of repositories aliased into each lines changed GraphQL query
+    contributor_batch_size = 20
+    # The contribution years rarely change, so they may be cached for longer
+    contrib_years_ttl = 24 * 3600
+    # Past years hardly ever change (only through backdated commits), so
+    # their statistics are only refreshed once a month
+    closed_year_ttl = 30 * 24 * 3600
+    # The current year changes all the time, but a rerun within a few minutes
+    # may reuse it
+    current_year_ttl = 10 * 60
+
     def __init__(
         self,
         username: str,
@@ -326,19 +1066,36 @@ class Stats(object):
         exclude_langs: Optional[Set] = None,
         ignore_forked_repos: bool = False,
         emails: Optional[List[str]] = None,
+        max_graphql: int = 10,
+        max_rest: int = 20,
+        json_loads: Callable[[Any], Any] = json_loads,
+        disk_cache: Optional[DiskCache] = None,
+        disk_cache_ttl: float = 3600,
     ):
         self.username = username
         self._ignore_forked_repos = ignore_forked_repos
-        self._exclude_repos = set() if exclude_repos is None else exclude_repos
+        self._exclude_repos = frozenset(exclude_repos or ())
         self._exclude_langs = set() if exclude_langs is None else exclude_langs
-        self.queries = Queries(username, access_token, session)
+        self.queries = Queries(
+            username,
+            access_token,
+            session,
+            max_graphql,
+            max_rest,
+            json_loads,
+            disk_cache=disk_cache,
+            disk_cache_ttl=disk_cache_ttl,
+        )
         self._emails = emails
 
         self._name: Optional[str] = None
+        self._user_id: Optional[str] = None
         self._stargazers: Optional[int] = None
         self._forks: Optional[int] = None
         self._forks_made: Optional[int] = None
         self._total_contributions: Optional[int] = None
+        # Contribution statistics of each year, by year
+        self._yearly: Optional[Dict[Any, Dict[str, Any]]] = None
         self._total_commits: Optional[int] = None
         self._prs: Optional[int] = None
         self._issues: Optional[int] = None
@@ -347,37 +1104,98 @@ class Stats(object):
         self._lines_changed: Optional[Tuple[int, int]] = None
         self._views: Optional[int] = None
 
-        # Lock to prevent concurrent get_stats calls
-        self._stats_lock: Optional[asyncio.Lock] = None
-        self._stats_fetched: bool = False
+        # Fetches in flight or completed, by name, so concurrent callers of
+        # get_stats and friends share one set of requests
+        self._fetches: Dict[str, asyncio.Future] = dict()
 
     async def to_str(self) -> str:
         """
         :return: summary of all available statistics
         """
-        languages = await self.languages_proportional
+        # Await every statistic at once, so independent fetches overlap
+        (
+            name,
+            stargazers,
+            forks,
+            total_contributions,
+            repos,
+            lines_changed,
+            views,
+            languages,
+        ) = await asyncio.gather(
+            self.name,
+            self.stargazers,
+            self.forks,
+            self.total_contributions,
+            self.repos,
+            self.lines_changed,
+            self.views,
+            self.languages_proportional,
+        )
         formatted_languages = "\n  - ".join(
             [f"{k}: {v:0.4f}%" for k, v in languages.items()]
         )
-        lines_changed = await self.lines_changed
-        return f"""Name: {await self.name}
-Stargazers: {await self.stargazers:,}
-Forks: {await self.forks:,}
-All-time contributions: {await self.total_contributions:,}
-Repositories with contributions: {len(await self.repos)}
+        return f"""Name: {name}
+Stargazers: {stargazers:,}
+Forks: {forks:,}
+All-time contributions: {total_contributions:,}
+Repositories with contributions: {len(repos)}
 Lines of code added: {lines_changed[0]:,}
 Lines of code deleted: {lines_changed[1]:,}
 Lines of code changed: {lines_changed[0] + lines_changed[1]:,}
-Project page views: {await self.views:,}
+Project page views: {views:,}
 Languages:
   - {formatted_languages}"""
 
+    async def get_all_stats(self) -> None:
+        """
+        Start every independent fetch at once, so that awaiting the individual
+        statistics afterwards does not wait on them one after another
+        """
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self.get_stats())
+            tg.create_task(self.get_summary_stats())
+            tg.create_task(self.get_user_forks())
+            tg.create_task(self.get_yearly_stats())
+
+    async def _single_flight(
+        self, name: str, fetch: Callable[[], Awaitable[None]]
+    ) -> None:
+        """
+        Run a fetch once, no matter how many coroutines ask for it. Later and
+        concurrent callers await the same future; a fetch that failed is
+        retried by the next caller.
+        :param name: name identifying the fetch
+        :param fetch: coroutine function that fetches and sets attributes
+        """
+        future = self._fetches.get(name)
+        if future is None or (
+            future.done() and (future.cancelled() or future.exception() is not None)
+        ):
+            future = asyncio.ensure_future(fetch())
+            self._fetches[name] = future
+        # Shield so a cancelled caller does not cancel the fetch for the others
+        await asyncio.shield(future)
+
     async def get_summary_stats(self) -> None:
         """
         Get lots of summary statistics using one big query. Sets many attributes.
         NOTE: This only sets _prs and _issues. Other stats come from get_stats()
         or dedicated methods to avoid conflicts.
+        Concurrent prs/issues awaits share one query.
         """
+        await self._single_flight("summary", self._get_summary_stats)
+
+    async def _get_summary_stats(self) -> None:
+        """
+        Fetch the summary statistics; use get_summary_stats instead
+        """
+        # Normally filled in by the first page of get_stats; the summary query
+        # is only a fallback in case that page failed
+        await self.get_stats()
+        if self._prs is not None and self._issues is not None:
+            return
+
         raw_results = await self.queries.query(self.queries.summary_query())
         if raw_results is None:
             return
@@ -395,136 +1213,178 @@ Languages:
     async def get_stats(self) -> None:
         """
         Get lots of summary statistics using one big query. Sets many attributes.
-        Thread-safe: uses lock to prevent concurrent calls.
-        """
-        # Initialize lock if needed
-        if self._stats_lock is None:
-            self._stats_lock = asyncio.Lock()
-
-        async with self._stats_lock:
-            # Check if already fetched (another coroutine may have done it while we waited)
-            if self._stats_fetched:
-                return
-
-            self._stargazers = 0
-            self._forks = 0
-            self._languages = dict()
-            self._repos = set()
-
-            exclude_langs_lower = {x.lower() for x in self._exclude_langs}
-            print(f"Fetching stats for user: {self.username}")
-            print(f"Excluding repositories: {self._exclude_repos}")
-            print(f"Excluding languages: {self._exclude_langs}")
-            print(f"Ignore forked repos: {self._ignore_forked_repos}")
-
-            next_owned = None
-            next_contrib = None
+        Concurrent calls share one fetch.
+        """
+        await self._single_flight("stats", self._get_stats)
+
+    async def _get_stats(self) -> None:
+        """
+        Fetch the repository statistics; use get_stats instead
+        """
+        # Accumulate into locals so concurrent readers never see partial
+        # totals; the attributes are only set once all pages are in
+        stargazers = 0
+        forks = 0
+        langs_total = 0
+        languages: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"size": 0, "occurrences": 0, "color": None}
+        )
+        repos_seen: Set[str] = set()
+        user_id: Optional[str] = None
+
+        exclude_repos = self._exclude_repos
+        exclude_langs_lower = {x.lower() for x in self._exclude_langs}
+        lang_excluded: Dict[str, bool] = dict()
+        logger.info("Fetching stats for user: %s", self.username)
+        logger.debug("Excluding repositories: %s", self._exclude_repos)
+        logger.debug("Excluding languages: %s", self._exclude_langs)
+        logger.debug("Ignore forked repos: %s", self._ignore_forked_repos)
+
+        def add_repos(repos: List[Optional[Dict[str, Any]]]) -> int:
+            """
+            Add a page of repository nodes to the running totals
+            :param repos: repository nodes, as returned by the API
+            :return: number of new repositories counted
+            """
+            nonlocal stargazers, forks, langs_total
+            processed_repos = 0
+            for repo in repos:
+                if repo is None:
+                    continue
+                name = repo.get("nameWithOwner")
+                if name in exclude_repos:
+                    continue
+                # add() is a no-op for repos already seen, so the size tells
+                # whether this one is new without a second lookup
+                seen_before = len(repos_seen)
+                repos_seen.add(name)
+                if len(repos_seen) == seen_before:
+                    continue
+                processed_repos += 1
+
+                stargazers += repo.get("stargazers", {}).get("totalCount", 0)
+                forks += repo.get("forkCount", 0)
+
+                repo_langs = repo.get("languages", {}).get("edges", [])
+                if repo_langs and logger.isEnabledFor(logging.DEBUG):
+                    lang_names = [
+                        entry.get("node", {}).get("name", "?") for entry in repo_langs
+                    ]
+                    logger.debug("  Repo %s: %s", name, lang_names)
+
+                for lang in repo_langs:
+                    node = lang.get("node") or {}
+                    lang_name = node.get("name", "Other")
+                    if exclude_langs_lower:
+                        # The same few names repeat on every page, so only
+                        # lowercase each of them once
+                        excluded = lang_excluded.get(lang_name)
+                        if excluded is None:
+                            excluded = lang_name.lower() in exclude_langs_lower
+                            lang_excluded[lang_name] = excluded
+                        if excluded:
+                            continue
+                    entry = languages[lang_name]
+                    lang_size = lang.get("size", 0)
+                    entry["size"] += lang_size
+                    langs_total += lang_size
+                    entry["occurrences"] += 1
+                    entry["color"] = entry["color"] or node.get("color")
+            return processed_repos
+
+        async def paginate(
+            page_query: Callable[[bool], str], field: str
+        ) -> None:
+            """
+            Fetch every page of one repository connection, counting each page
+            as soon as it arrives
+            :param page_query: function building the query, given whether it
+                               is for the first page; the cursor is passed as
+                               a variable, so the query text stays the same
+            :param field: name of the connection in the viewer object
+            """
+            nonlocal user_id
+            cursor = None
             page_count = 0
             while True:
                 page_count += 1
-                print(f"Fetching page {page_count}...")
-
+                logger.debug("Fetching %s page %d...", field, page_count)
                 raw_results = await self.queries.query(
-                    Queries.repos_overview(
-                        owned_cursor=next_owned, contrib_cursor=next_contrib
-                    )
+                    page_query(cursor is None), variables={"cursor": cursor}
                 )
-                raw_results = raw_results if raw_results is not None else {}
-
-                self._name = (
-                    raw_results.get("data", {}).get("viewer", {}).get("name", None)
+                viewer = (raw_results or {}).get("data", {}).get("viewer", {})
+
+                if "login" in viewer:
+                    user_id = viewer.get("id", user_id)
+                    self._name = viewer.get("name") or viewer.get("login", "No Name")
+                if "pullRequests" in viewer and "issues" in viewer:
+                    self._prs = viewer["pullRequests"].get("totalCount", 0)
+                    self._issues = viewer["issues"].get("totalCount", 0)
+
+                connection = viewer.get(field) or {}
+                processed_repos = add_repos(connection.get("nodes") or [])
+                logger.debug(
+                    "Processed %d repositories on %s page %d",
+                    processed_repos,
+                    field,
+                    page_count,
                 )
-                if self._name is None:
-                    self._name = (
-                        raw_results.get("data", {})
-                        .get("viewer", {})
-                        .get("login", "No Name")
-                    )
 
-                contrib_repos = (
-                    raw_results.get("data", {})
-                    .get("viewer", {})
-                    .get("repositoriesContributedTo", {})
-                )
-                owned_repos = (
-                    raw_results.get("data", {})
-                    .get("viewer", {})
-                    .get("repositories", {})
-                )
-
-                repos = owned_repos.get("nodes", [])
-                if not self._ignore_forked_repos:
-                    repos += contrib_repos.get("nodes", [])
-
-                processed_repos = 0
-                for repo in repos:
-                    if repo is None:
-                        continue
-                    name = repo.get("nameWithOwner")
-                    if name in self._repos or name in self._exclude_repos:
-                        continue
-                    self._repos.add(name)
-                    processed_repos += 1
-
-                    self._stargazers += repo.get("stargazers", {}).get("totalCount", 0)
-                    self._forks += repo.get("forkCount", 0)
-
-                    repo_langs = repo.get("languages", {}).get("edges", [])
-                    if repo_langs:
-                        lang_names = [
-                            entry.get("node", {}).get("name", "?") for entry in repo_langs
-                        ]
-                        print(f"  Repo {name}: {lang_names}")
-
-                    for lang in repo_langs:
-                        lang_name = lang.get("node", {}).get("name", "Other")
-                        lang_size = lang.get("size", 0)
-                        if lang_name.lower() in exclude_langs_lower:
-                            continue
-                        if lang_name in self._languages:
-                            self._languages[lang_name]["size"] += lang_size
-                            self._languages[lang_name]["occurrences"] += 1
-                        else:
-                            self._languages[lang_name] = {
-                                "size": lang_size,
-                                "occurrences": 1,
-                                "color": lang.get("node", {}).get("color"),
-                            }
-
-                print(f"Processed {processed_repos} repositories on page {page_count}")
-
-                if owned_repos.get("pageInfo", {}).get(
-                    "hasNextPage", False
-                ) or contrib_repos.get("pageInfo", {}).get("hasNextPage", False):
-                    next_owned = owned_repos.get("pageInfo", {}).get(
-                        "endCursor", next_owned
-                    )
-                    next_contrib = contrib_repos.get("pageInfo", {}).get(
-                        "endCursor", next_contrib
-                    )
-                else:
+                page_info = connection.get("pageInfo", {})
+                if not page_info.get("hasNextPage", False):
                     break
+                cursor = page_info.get("endCursor", cursor)
+
+        # The two connections have independent cursors, so page through both
+        # at the same time
+        # The first owned page also carries the summary counts, which saves
+        # get_summary_stats a separate query
+        paginators = [
+            paginate(
+                lambda first: Queries.owned_repos_page(include_summary=first),
+                "repositories",
+            )
+        ]
+        if not self._ignore_forked_repos:
+            paginators.append(
+                paginate(
+                    lambda first: Queries.contrib_repos_page(),
+                    "repositoriesContributedTo",
+                )
+            )
+        await asyncio.gather(*paginators)
 
-            print(f"Total repositories found: {len(self._repos)}")
-            print(f"Languages found: {len(self._languages)}")
+        logger.info("Total repositories found: %d", len(repos_seen))
+        logger.info("Languages found: %d", len(languages))
 
-            langs_total = sum([v.get("size", 0) for v in self._languages.values()])
-            for k, v in self._languages.items():
-                v["prop"] = (
-                    100 * (v.get("size", 0) / langs_total) if langs_total > 0 else 0
-                )
+        # langs_total was summed while the pages were counted
+        for v in languages.values():
+            v["prop"] = (
+                100 * (v.get("size", 0) / langs_total) if langs_total > 0 else 0
+            )
 
-            # Debug: show language breakdown
-            print("Language breakdown (by size):")
+        # Debug: show language breakdown
+        if logger.isEnabledFor(logging.DEBUG):
             sorted_langs = sorted(
-                self._languages.items(), key=lambda x: x[1].get("size", 0), reverse=True
+                languages.items(), key=lambda x: x[1].get("size", 0), reverse=True
+            )
+            logger.debug(
+                "Language breakdown (by size):\n%s",
+                "\n".join(
+                    f"  {lang_name}: {lang_data.get('size', 0):,} bytes "
+                    f"({lang_data.get('prop', 0):.2f}%)"
+                    for lang_name, lang_data in sorted_langs[:15]  # Top 15
+                ),
             )
-            for lang_name, lang_data in sorted_langs[:15]:  # Top 15
-                print(
-                    f"  {lang_name}: {lang_data.get('size', 0):,} bytes ({lang_data.get('prop', 0):.2f}%)"
-                )
 
-            self._stats_fetched = True
+        self._stargazers = stargazers
+        self._forks = forks
+        self._languages = dict(languages)
+        self._repos = repos_seen
+        self._user_id = user_id
+        # The first owned page failed, so there was no login to fall back to
+        if self._name is None:
+            self._name = "No Name"
 
     @property
     async def name(self) -> str:
@@ -564,7 +1424,9 @@ Languages:
 
         # Retornar a soma total
         total = forks_received + forks_made
-        print(f"Total forks: {forks_received} received + {forks_made} made = {total}")
+        logger.info(
+            "Total forks: %d received + %d made = %d", forks_received, forks_made, total
+        )
 
         return total
 
@@ -609,33 +1471,106 @@ Languages:
         if self._total_contributions is not None:
             return self._total_contributions
 
-        print("Fetching total contributions from all years...")
-        self._total_contributions = 0
+        await self.get_yearly_stats()
+        assert self._yearly is not None
+        self._total_contributions = sum(
+            year.get("contributionCalendar", {}).get("totalContributions", 0)
+            for year in self._yearly.values()
+        )
+        logger.info("Total contributions (all years): %d", self._total_contributions)
+        return self._total_contributions
+
+    async def get_yearly_stats(self) -> None:
+        """
+        Get the contributions and commits of every contribution year with one
+        query, shared by total_contributions and get_all_time_commits.
+        Concurrent calls share one fetch.
+        """
+        await self._single_flight("yearly", self._get_yearly_stats)
+
+    async def _get_yearly_stats(self) -> None:
+        """
+        Fetch the statistics of every year; use get_yearly_stats instead
+        """
+        logger.info("Fetching contributions and commits from all years...")
         years = (
-            (await self.queries.query(Queries.contrib_years()))
+            (
+                await self.queries.query(
+                    Queries.contrib_years(), disk_ttl=self.contrib_years_ttl
+                )
+            )
             .get("data", {})
             .get("viewer", {})
             .get("contributionsCollection", {})
             .get("contributionYears", [])
         )
-        print(f"Found contribution years: {years}")
+        logger.info("Found contribution years: %s", years)
 
         if not years:
-            print("WARNING: No contribution years found!")
-            return 0
+            logger.warning("No contribution years found!")
+            self._yearly = dict()
+            return
 
-        by_year = (
-            (await self.queries.query(Queries.all_contribs(years)))
-            .get("data", {})
-            .get("viewer", {})
-            .values()
-        )
-        for year in by_year:
-            contrib = year.get("contributionCalendar", {}).get("totalContributions", 0)
-            self._total_contributions += contrib
+        # Past years are over, so their statistics are taken from the disk
+        # cache when possible and only the rest are queried. The current year
+        # is reused briefly too, so a rerun shortly after (e.g., a retried CI
+        # job) does not query it again.
+        disk_cache = self.queries.disk_cache
+        this_year = time.gmtime().tm_year
+        cached: Dict[Any, Dict[str, Any]] = dict()
+        if disk_cache is not None:
+            for year in years:
+                closed = int(year) < this_year
+                stats = disk_cache.get(
+                    self._year_cache_key(year, closed),
+                    self.closed_year_ttl if closed else self.current_year_ttl,
+                )
+                if stats:
+                    cached[year] = stats
+                    if not closed:
+                        logger.info(
+                            "Year %s: %d commits (cached)",
+                            year,
+                            stats.get("totalCommitContributions", 0)
+                            + stats.get("restrictedContributionsCount", 0),
+                        )
+        missing = [year for year in years if year not in cached]
+        by_year: Dict[str, Any] = dict()
+        if missing:
+            logger.info("Querying years %s (%d cached)", missing, len(cached))
+            # The per-year entries above are the cache that matters; keep the
+            # response cache from serving the current year for longer
+            by_year = (
+                (
+                    await self.queries.query(
+                        Queries.all_contribs_and_commits(missing),
+                        disk_ttl=self.current_year_ttl,
+                    )
+                )
+                .get("data", {})
+                .get("viewer", {})
+            ) or {}
 
-        print(f"Total contributions (all years): {self._total_contributions}")
-        return cast(int, self._total_contributions)
+        self._yearly = dict()
+        for year in years:
+            if year in cached:
+                self._yearly[year] = cached[year]
+                continue
+            stats = by_year.get(f"year{year}") or {}
+            self._yearly[year] = stats
+            if stats and disk_cache is not None:
+                disk_cache.put(
+                    self._year_cache_key(year, int(year) < this_year), stats
+                )
+
+    def _year_cache_key(self, year: Any, closed: bool) -> str:
+        """
+        :param year: contribution year
+        :param closed: whether the year is over; the partial statistics stored
+                       during a year must not be reused once it has ended
+        :return: disk cache key of the statistics of that year
+        """
+        return Queries.cache_key("year", self.username, str(year), closed)
 
     @property
     async def lines_changed(self) -> Tuple[int, int]:
@@ -646,18 +1581,68 @@ Languages:
             return self._lines_changed
         additions = 0
         deletions = 0
-        repos = await self.repos
-        print(f"Calculating lines changed for {len(repos)} repositories...")
+        repos = list(await self.repos)
+        logger.info("Calculating lines changed for %d repositories...", len(repos))
+
+        # Count the user's commits on each default branch with one aliased
+        # GraphQL query per batch of repos, instead of one REST call per repo
+        rest_repos = []
+        if self._user_id is None:
+            rest_repos = repos
+        else:
+            batches = list(batched(repos, self.contributor_batch_size))
+            results = await asyncio.gather(
+                *[
+                    self.queries.query(
+                        Queries.repo_contributor_stats_batch(batch, self._user_id)
+                    )
+                    for batch in batches
+                ],
+                return_exceptions=True,
+            )
+            for batch, r in zip(batches, results):
+                if isinstance(r, BaseException) or not isinstance(r, dict):
+                    logger.warning(
+                        "Error processing batch of %d repos: %s", len(batch), r
+                    )
+                    rest_repos += batch
+                    continue
+                data = r.get("data") or {}
+                for i, repo in enumerate(batch):
+                    branch = (data.get(f"r{i}") or {}).get("defaultBranchRef") or {}
+                    history = (branch.get("target") or {}).get("history")
+                    # Repos that are missing, empty, or have more commits than
+                    # fit in one page are counted through the REST API
+                    if not history or history.get("pageInfo", {}).get("hasNextPage"):
+                        rest_repos.append(repo)
+                        continue
+                    for commit in history.get("nodes") or []:
+                        additions += commit.get("additions", 0)
+                        deletions += commit.get("deletions", 0)
 
-        for i, repo in enumerate(repos):
-            try:
-                print(f"Processing repository {i + 1}/{len(repos)}: {repo}")
-                r = await self.queries.query_rest(f"/repos/{repo}/stats/contributors")
+        if rest_repos:
+            rest_additions, rest_deletions = await self.lines_changed_rest(rest_repos)
+            additions += rest_additions
+            deletions += rest_deletions
 
-                if not r or not isinstance(r, list):
-                    print(f"Invalid response for {repo}: {type(r)}")
-                    continue
+        logger.info("Total lines: +%d, -%d", additions, deletions)
+        self._lines_changed = (additions, deletions)
+        return self._lines_changed
 
+    async def lines_changed_rest(self, repos: List[str]) -> Tuple[int, int]:
+        """
+        Count lines changed using the REST contributor statistics of each repo
+        :param repos: names of repositories, as "owner/name"
+        :return: count of lines added and removed by the user in those repos
+        """
+        additions = 0
+        deletions = 0
+        logger.info(
+            "Fetching contributor statistics for %d repositories...", len(repos)
+        )
+
+        for repo, r in await self._query_each_repo(repos, "stats/contributors", list):
+            try:
                 for author_obj in r:
                     # Handle malformed response from the API by skipping this repo
                     if not isinstance(author_obj, dict) or not isinstance(
@@ -676,14 +1661,37 @@ Languages:
                         if isinstance(week, dict):
                             additions += week.get("a", 0)
                             deletions += week.get("d", 0)
-
             except Exception as e:
-                print(f"Error processing {repo}: {e}")
+                logger.warning("Error processing %s: %s", repo, e)
                 continue
 
-        print(f"Total lines: +{additions}, -{deletions}")
-        self._lines_changed = (additions, deletions)
-        return self._lines_changed
+        return additions, deletions
+
+    async def _query_each_repo(
+        self, repos: List[str], endpoint: str, result_type: type
+    ) -> List[Tuple[str, Any]]:
+        """
+        Query the same REST endpoint of every repository, issuing all requests
+        up front; the REST semaphore bounds concurrency
+        :param repos: names of repositories, as "owner/name"
+        :param endpoint: path below the repository (e.g., "traffic/views")
+        :param result_type: type of a valid response
+        :return: repository names and valid responses; failed and invalid
+                 responses are logged and left out
+        """
+        results = await asyncio.gather(
+            *[self.queries.query_rest(f"/repos/{repo}/{endpoint}") for repo in repos],
+            return_exceptions=True,
+        )
+        valid = []
+        for repo, r in zip(repos, results):
+            if isinstance(r, BaseException):
+                logger.warning("Error fetching %s of %s: %s", endpoint, repo, r)
+            elif not r or not isinstance(r, result_type):
+                logger.warning("Invalid response for %s: %s", repo, type(r))
+            else:
+                valid.append((repo, r))
+        return valid
 
     @property
     async def views(self) -> int:
@@ -695,18 +1703,11 @@ Languages:
             return self._views
 
         total = 0
-        repos = await self.repos
-        print(f"Calculating views for {len(repos)} repositories...")
+        repos = list(await self.repos)
+        logger.info("Calculating views for %d repositories...", len(repos))
 
-        for i, repo in enumerate(repos):
+        for repo, r in await self._query_each_repo(repos, "traffic/views", dict):
             try:
-                print(f"Processing views for repository {i + 1}/{len(repos)}: {repo}")
-                r = await self.queries.query_rest(f"/repos/{repo}/traffic/views")
-
-                if not r or not isinstance(r, dict):
-                    print(f"Invalid response for {repo}: {type(r)}")
-                    continue
-
                 views_data = r.get("views", [])
                 if not isinstance(views_data, list):
                     continue
@@ -714,12 +1715,11 @@ Languages:
                 for view in views_data:
                     if isinstance(view, dict):
                         total += view.get("count", 0)
-
             except Exception as e:
-                print(f"Error processing views for {repo}: {e}")
+                logger.warning("Error processing views for %s: %s", repo, e)
                 continue
 
-        print(f"Total views (last 14 days): {total}")
+        logger.info("Total views (last 14 days): %d", total)
         self._views = total
         return total
 
@@ -728,45 +1728,25 @@ Languages:
         """
         Get the total number of commits made by the user (igual ao script original).
         """
-        total_commits = 0
-        if self._emails:
-            for email in self._emails:
-                query = f'''
-                query {{
-                  user(login: "{self.username}") {{
-                    contributionsCollection {{
-                      totalCommitContributions
-                    }}
-                  }}
-                }}
-                '''
-                response = await self.queries.query(query)
-                if "data" in response and "user" in response["data"]:
-                    total_commit = response["data"]["user"]["contributionsCollection"][
-                        "totalCommitContributions"
-                    ]
-                    total_commits += total_commit
-                else:
-                    print(f"Erro ao buscar commits para email {email}: {response}")
+        response = await self.queries.query(
+            Queries.user_commits(), variables={"login": self.username}
+        )
+        if "data" in response and response["data"].get("user"):
+            total_commits = response["data"]["user"]["contributionsCollection"][
+                "totalCommitContributions"
+            ]
         else:
-            query = f'''
-            query {{
-              user(login: "{self.username}") {{
-                contributionsCollection {{
-                  totalCommitContributions
-                }}
-              }}
-            }}
-            '''
-            response = await self.queries.query(query)
-            if "data" in response and "user" in response["data"]:
-                total_commits = response["data"]["user"]["contributionsCollection"][
-                    "totalCommitContributions"
-                ]
-            else:
-                print(
-                    f"Erro ao buscar commits para username {self.username}: {response}"
-                )
+            logger.warning(
+                "Erro ao buscar commits para username %s: %s",
+                self.username,
+                response,
+            )
+            return 0
+        # The API cannot filter commit contributions by email, so the query
+        # used to be sent once per configured address with identical results;
+        # it is sent once and counted per address, as before
+        if self._emails:
+            total_commits *= len(self._emails)
         return total_commits
 
     @property
@@ -793,62 +1773,23 @@ Languages:
 
     async def get_user_forks(self) -> None:
         """
-        Get repositories forked by the user
+        Get repositories forked by the user. Concurrent calls share one fetch.
         """
-        if self._forks_made is not None:
-            return
-
-        print("Fetching forks made by user...")
-
-        total_forks = 0
-        cursor = None
-
-        while True:
-            query = f"""
-query {{
-  viewer {{
-    repositories(first: 100, isFork: true, ownerAffiliations: OWNER, after: {"null" if cursor is None else '"' + cursor + '"'}) {{
-      totalCount
-      pageInfo {{
-        hasNextPage
-        endCursor
-      }}
-      nodes {{
-        nameWithOwner
-        parent {{
-          nameWithOwner
-        }}
-      }}
-    }}
-  }}
-}}
-"""
-            raw_results = await self.queries.query(query)
-
-            if raw_results is None:
-                self._forks_made = 0
-                return
-
-            viewer = raw_results.get("data", {}).get("viewer", {})
-            if not viewer:
-                self._forks_made = 0
-                return
-
-            repositories = viewer.get("repositories", {})
+        await self._single_flight("forks", self._get_user_forks)
 
-            # Na primeira página, pegamos o totalCount
-            if cursor is None:
-                total_forks = repositories.get("totalCount", 0)
+    async def _get_user_forks(self) -> None:
+        """
+        Fetch the number of forks made by the user; use get_user_forks instead
+        """
+        logger.info("Fetching forks made by user...")
 
-            # Verificar se há mais páginas
-            page_info = repositories.get("pageInfo", {})
-            if page_info.get("hasNextPage"):
-                cursor = page_info.get("endCursor")
-            else:
-                break
+        # totalCount comes with the first page, so no need to page through
+        raw_results = await self.queries.query(Queries.user_forks())
+        viewer = (raw_results or {}).get("data", {}).get("viewer", {})
+        total_forks = viewer.get("repositories", {}).get("totalCount", 0)
 
         self._forks_made = total_forks
-        print(f"Found {self._forks_made} forks made by user")
+        logger.info("Found %d forks made by user", self._forks_made)
 
     @property
     async def forks_made(self) -> int:
@@ -863,51 +1804,38 @@ query {{
 
     async def get_all_time_commits(self) -> None:
         """
-        Get total commits from all years via GraphQL
+        Get total commits from all years via GraphQL. Concurrent calls share
+        one fetch.
         """
-        print("Fetching total commits from all years...")
-
-        # Buscar todos os anos de contribuição
-        years = (
-            (await self.queries.query(Queries.contrib_years()))
-            .get("data", {})
-            .get("viewer", {})
-            .get("contributionsCollection", {})
-            .get("contributionYears", [])
-        )
+        await self._single_flight("all_time_commits", self._get_all_time_commits)
 
-        print(f"Found contribution years: {years}")
+    async def _get_all_time_commits(self) -> None:
+        """
+        Fetch the commits from all years; use get_all_time_commits instead
+        """
+        await self.get_yearly_stats()
+        assert self._yearly is not None
         total_commits = 0
+        # Collected and logged as one record each, instead of one per year
+        by_year = []
+        failed = []
 
-        # Para cada ano, buscar o total de commits
-        for year in years:
-            query = f"""
-query {{
-  viewer {{
-    contributionsCollection(from: "{year}-01-01T00:00:00Z", to: "{int(year) + 1}-01-01T00:00:00Z") {{
-      totalCommitContributions
-      restrictedContributionsCount
-    }}
-  }}
-}}
-"""
-            result = await self.queries.query(query)
-            if result and "data" in result:
-                contrib = (
-                    result.get("data", {})
-                    .get("viewer", {})
-                    .get("contributionsCollection", {})
-                )
+        for year, contrib in self._yearly.items():
+            if contrib:
                 year_commits = contrib.get("totalCommitContributions", 0) + contrib.get(
                     "restrictedContributionsCount", 0
                 )
                 total_commits += year_commits
-                print(f"  Year {year}: {year_commits} commits")
+                by_year.append(f"  Year {year}: {year_commits} commits")
             else:
-                print(f"  Year {year}: Failed to fetch data")
+                failed.append(str(year))
 
+        if failed:
+            logger.warning("Failed to fetch data for years: %s", ", ".join(failed))
+        if by_year and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Commits by year:\n%s", "\n".join(by_year))
         self._total_commits = total_commits
-        print(f"Total commits from all years: {total_commits}")
+        logger.info("Total commits from all years: %d", total_commits)
 
 
 ###############################################################################
@@ -919,16 +1847,17 @@ async def main() -> None:
     """
     Used mostly for testing; this module is not usually run standalone
     """
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     access_token = os.getenv("ACCESS_TOKEN")
     user = os.getenv("GITHUB_ACTOR")
     if access_token is None or user is None:
         raise RuntimeError(
             "ACCESS_TOKEN and GITHUB_ACTOR environment variables cannot be None!"
         )
-    async with aiohttp.ClientSession() as session:
+    async with get_session() as session:
         s = Stats(user, access_token, session)
         print(await s.to_str())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())